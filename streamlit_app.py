@@ -1,176 +1,430 @@
 import streamlit as st
 import pandas as pd
-import datetime
-import os
-import json
+import sqlite3
+from datetime import datetime
 import altair as alt
 
 # =========================================================
 # CONFIG
 # =========================================================
-DATA_FILE = "waste_data.csv"
-LOG_FILE = "waste_log.json"
+DB_PATH = "waste_tracker.db"
 MAX_CAPACITY = 1000  # kg limit
 st.set_page_config(page_title="Waste Tracker", layout="wide")
 
 # =========================================================
-# INITIAL SETUP
+# DATABASE
 # =========================================================
-def load_data():
-    if os.path.exists(DATA_FILE):
-        return pd.read_csv(DATA_FILE)
-    return pd.DataFrame(columns=["Date", "Business", "Stream", "Quantity (kg)"])
+# SQL hoisted to constants: SQLite caches prepared plans by statement
+# text, so passing the identical string object every call guarantees a
+# cache hit on the hot insert/query paths.
+_SQL_INSERT_WASTE = "INSERT INTO waste (date, business, stream, quantity) VALUES (?, ?, ?, ?)"
+_SQL_INSERT_AUDIT = (
+    "INSERT INTO audit (event, entry_date, business, stream, quantity, ts) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+_SQL_ARCHIVE_WASTE = (
+    "INSERT INTO audit (event, entry_date, business, stream, quantity, ts) "
+    "SELECT 'reset', date, business, stream, quantity, ? FROM waste"
+)
+_SQL_MONTHLY = (
+    "SELECT id, date, business, stream, quantity FROM waste "
+    "WHERE date >= ? AND date < ? ORDER BY date"
+)
+_SQL_MONTHLY_BY_STREAM = (
+    "SELECT stream, SUM(quantity) FROM waste WHERE date >= ? AND date < ? GROUP BY stream"
+)
+_SQL_MONTHLY_BY_BUSINESS = (
+    "SELECT business, SUM(quantity) FROM waste WHERE date >= ? AND date < ? GROUP BY business"
+)
+_SQL_ANNUAL_TOTAL = "SELECT COALESCE(SUM(quantity), 0) FROM waste WHERE date >= ? AND date < ?"
+_SQL_TOTAL_STORED = "SELECT COALESCE(SUM(quantity), 0) FROM waste"
+_SQL_AUDIT_RECENT = (
+    "SELECT id, event, entry_date, business, stream, quantity, ts FROM audit "
+    "ORDER BY id DESC LIMIT ?"
+)
+_SQL_AUDIT_ALL = (
+    "SELECT id, event, entry_date, business, stream, quantity, ts FROM audit ORDER BY id DESC"
+)
 
-def save_data(df):
-    df.to_csv(DATA_FILE, index=False)
+def init_db():
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    # WAL is the only persistent pragma: it is recorded in the database
+    # file. The per-connection pragmas live in get_conn so they apply
+    # to the handle that actually serves queries.
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS waste (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            business TEXT NOT NULL,
+            stream TEXT NOT NULL,
+            quantity REAL NOT NULL
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS audit (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event TEXT NOT NULL,
+            entry_date TEXT,
+            business TEXT,
+            stream TEXT,
+            quantity REAL,
+            ts TEXT NOT NULL
+        )
+    """)
+    # The monthly and annual queries filter on half-open date ranges
+    # that this index can seek.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_waste_date ON waste(date)")
+    # No index on audit: ORDER BY id DESC is a reverse rowid walk, since
+    # an INTEGER PRIMARY KEY is an alias for the rowid.
+    c.execute("DROP INDEX IF EXISTS idx_audit_id_desc")
+    conn.commit()
+    conn.close()
 
-def log_action(action, record=None):
-    log_entry = {
-        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "action": action,
-        "record": record
-    }
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "r") as f:
-            logs = json.load(f)
+@st.cache_resource
+def get_conn():
+    """Single long-lived connection shared across reruns.
+
+    check_same_thread=False is safe here because Streamlit serializes
+    script runs per session; the cached handle keeps SQLite's page
+    cache warm instead of reopening the file on every query.
+    """
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+    # WAL halves the fsyncs per commit and lets readers run alongside
+    # writers; NORMAL lets those fsyncs coalesce instead of forcing one
+    # per INSERT. The busy timeout covers concurrent sessions.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+def _utc_ts():
+    return datetime.utcnow().isoformat()
+
+def insert_entry(entry_date, business, stream, quantity):
+    conn = get_conn()
+    # One transaction, one commit: the waste row and its audit record
+    # land together.
+    with conn:
+        conn.execute(_SQL_INSERT_WASTE, (entry_date, business, stream, quantity))
+        conn.execute(_SQL_INSERT_AUDIT, ("add", entry_date, business, stream, quantity, _utc_ts()))
+    _clear_query_caches()
+
+def delete_entry(entry_id):
+    conn = get_conn()
+    c = conn.cursor()
+    row = c.execute(
+        "SELECT date, business, stream, quantity FROM waste WHERE id = ?", (entry_id,)
+    ).fetchone()
+    if row is None:
+        return
+    c.execute("DELETE FROM waste WHERE id = ?", (entry_id,))
+    c.execute(_SQL_INSERT_AUDIT, ("delete", row[0], row[1], row[2], row[3], _utc_ts()))
+    conn.commit()
+    _clear_query_caches()
+
+def reset_inventory():
+    conn = get_conn()
+    ts = _utc_ts()
+    # Archive and clear in one transaction, with the copy done entirely
+    # inside SQLite rather than row-by-row through Python.
+    with conn:
+        conn.execute(_SQL_ARCHIVE_WASTE, (ts,))
+        conn.execute("DELETE FROM waste")
+    _clear_query_caches()
+
+def _clear_query_caches():
+    """Invalidate cached query results after any write to the waste table."""
+    get_monthly_entries.clear()
+    get_monthly_aggregates.clear()
+    get_annual_total.clear()
+
+def _month_bounds(ym):
+    """Half-open [first day, first day of next month) range for a 'YYYY-MM'."""
+    year, month = map(int, ym.split("-"))
+    if month == 12:
+        nxt = f"{year + 1:04d}-01-01"
     else:
-        logs = []
-    logs.append(log_entry)
-    with open(LOG_FILE, "w") as f:
-        json.dump(logs, f, indent=2)
+        nxt = f"{year:04d}-{month + 1:02d}-01"
+    return f"{ym}-01", nxt
+
+@st.cache_data(ttl=60)
+def get_monthly_entries(ym):
+    conn = get_conn()
+    return conn.execute(_SQL_MONTHLY, _month_bounds(ym)).fetchall()
+
+def get_all_audit(limit=200):
+    conn = get_conn()
+    return conn.execute(_SQL_AUDIT_RECENT, (limit,)).fetchall()
+
+def iter_audit(chunk=1000):
+    """Yield audit rows newest-first in fetchmany batches.
+
+    Unlike get_all_audit, memory stays bounded by the chunk size no
+    matter how large the audit table grows.
+    """
+    conn = get_conn()
+    c = conn.execute(_SQL_AUDIT_ALL)
+    while True:
+        rows = c.fetchmany(chunk)
+        if not rows:
+            break
+        yield from rows
+
+@st.cache_data(ttl=60)
+def get_monthly_aggregates(ym):
+    """Per-stream and per-business totals for a month, summed inside SQLite."""
+    conn = get_conn()
+    bounds = _month_bounds(ym)
+    stream_totals = dict(conn.execute(_SQL_MONTHLY_BY_STREAM, bounds).fetchall())
+    business_totals = dict(conn.execute(_SQL_MONTHLY_BY_BUSINESS, bounds).fetchall())
+    return stream_totals, business_totals
+
+# Longer TTL than the monthly queries: the annual figure only moves on
+# writes, and every write path clears this cache explicitly.
+@st.cache_data(ttl=300)
+def get_annual_total(year):
+    conn = get_conn()
+    return conn.execute(
+        _SQL_ANNUAL_TOTAL, (f"{year}-01-01", f"{year + 1}-01-01")
+    ).fetchone()[0]
+
+def _fmt(value):
+    return "" if value is None else str(value)
+
+def iter_audit_csv():
+    """Yield the audit table as CSV one row at a time.
+
+    Lazy on purpose: nothing is read from the audit table until the
+    export is actually requested, and peak memory stays at one row.
+    """
+    yield "id,event,entry_date,business,stream,quantity,ts\n"
+    for row in iter_audit():
+        yield ",".join(map(_fmt, row)) + "\n"
+
+@st.cache_resource
+def _ensure_schema():
+    """Run init_db once per process instead of on every rerun."""
+    init_db()
+    return True
+
+_ensure_schema()
+
+# =========================================================
+# CHART BUILDERS
+# =========================================================
+@st.cache_data
+def build_stream_chart(items):
+    """Vega-Lite spec for the per-stream bar chart.
+
+    Takes the aggregated totals as a sorted tuple of pairs so the cache
+    key is just the data; identical totals reuse the prior spec.
+    """
+    stream_df = pd.DataFrame(
+        {"Stream": [k for k, _ in items], "Quantity (kg)": [v for _, v in items]}
+    )
+    chart = (
+        alt.Chart(stream_df)
+        .mark_bar()
+        .encode(
+            x=alt.X("Stream:N", title="Waste Stream"),
+            y=alt.Y("Quantity (kg):Q", title="Quantity (kg)"),
+            color="Stream:N",
+            tooltip=["Stream", "Quantity (kg)"],
+        )
+        .properties(height=300, title="This Month by Stream")
+    )
+    return chart.to_dict()
+
+@st.cache_data
+def build_business_chart(items):
+    """Vega-Lite spec for the per-business pie chart."""
+    business_df = pd.DataFrame(
+        {"Business": [k for k, _ in items], "Quantity (kg)": [v for _, v in items]}
+    )
+    chart = (
+        alt.Chart(business_df)
+        .mark_arc()
+        .encode(
+            theta=alt.Theta("Quantity (kg):Q"),
+            color="Business:N",
+            tooltip=["Business", "Quantity (kg)"],
+        )
+        .properties(height=300, title="This Month by Business")
+    )
+    return chart.to_dict()
 
 # =========================================================
 # APP TITLE
 # =========================================================
+# Read the clock once per rerun rather than in every section below.
+_now = datetime.now()
+current_month = f"{_now.year:04d}-{_now.month:02d}"
+current_year = _now.year
+
 st.title("♻️ Waste Inventory Tracker")
 st.markdown("Track, visualize, and manage your site waste capacity in real time.")
 
 # =========================================================
-# LOAD & DISPLAY DATA
+# SIDEBAR: AUDIT EXPORT
 # =========================================================
-df = load_data()
+with st.sidebar:
+    st.subheader("Audit Export")
+    if st.button("📄 Prepare audit CSV"):
+        st.session_state["audit_csv"] = "".join(iter_audit_csv())
+    if "audit_csv" in st.session_state:
+        st.download_button(
+            "⬇️ Download audit CSV",
+            st.session_state["audit_csv"],
+            file_name="audit_log.csv",
+            mime="text/csv",
+        )
 
 # =========================================================
 # INPUT FORM
 # =========================================================
-st.subheader("Add New Waste Entry")
-col1, col2, col3, col4 = st.columns(4)
-
-with col1:
-    date = st.date_input("Date", datetime.date.today())
-
-with col2:
-    business = st.selectbox("Business", ["DAB", "CTI"])
-
-with col3:
-    stream = st.selectbox("Waste Stream", ["ACN", "DCM"])
-
-with col4:
-    quantity = st.number_input("Quantity (kg)", min_value=0.0, step=0.1)
-
-if st.button("➕ Add Entry"):
-    new_entry = {
-        "Date": date.strftime("%Y-%m-%d"),
-        "Business": business,
-        "Stream": stream,
-        "Quantity (kg)": quantity,
-    }
-    df = pd.concat([df, pd.DataFrame([new_entry])], ignore_index=True)
-    save_data(df)
-    log_action("ADD_ENTRY", new_entry)
-    st.success("✅ Entry added successfully!")
-
-# =========================================================
-# DELETE ENTRIES
-# =========================================================
-st.subheader("Manage Entries")
-if not df.empty:
-    selected_row = st.selectbox("Select an entry to delete", df.index, format_func=lambda x: f"{df.loc[x, 'Date']} - {df.loc[x, 'Business']} - {df.loc[x, 'Stream']} ({df.loc[x, 'Quantity (kg)']} kg)")
-    if st.button("🗑️ Delete Selected Entry"):
-        confirm = st.checkbox("Are you sure you want to delete this entry?")
-        if confirm:
-            deleted = df.loc[selected_row].to_dict()
-            df = df.drop(selected_row).reset_index(drop=True)
-            save_data(df)
-            log_action("DELETE_ENTRY", deleted)
-            st.success("✅ Entry deleted.")
-        else:
-            st.warning("⚠️ Please confirm deletion before proceeding.")
-else:
-    st.info("No entries yet. Add some to get started.")
+# Fragments keep widget interactions local: typing in the form or
+# selecting a table row reruns only that section. Mutations escalate
+# with st.rerun(scope="app") since every section reads the same tables.
+@st.fragment
+def add_entry_form():
+    st.subheader("Add New Waste Entry")
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        entry_date = st.date_input("Date", _now.date())
+
+    with col2:
+        business = st.selectbox("Business", ["DAB", "CTI"])
+
+    with col3:
+        stream = st.selectbox("Waste Stream", ["ACN", "DCM"])
+
+    with col4:
+        quantity = st.number_input("Quantity (kg)", min_value=0.0, step=0.1)
+
+    if st.button("➕ Add Entry"):
+        insert_entry(entry_date.strftime("%Y-%m-%d"), business, stream, quantity)
+        st.toast("✅ Entry added successfully!")
+        st.rerun(scope="app")
+
+add_entry_form()
+
+# =========================================================
+# THIS MONTH'S ENTRIES
+# =========================================================
+@st.fragment
+def monthly_entries_section():
+    st.subheader(f"Entries for {current_month}")
+    entries = get_monthly_entries(current_month)
+    if not entries:
+        st.info("No entries yet this month. Add some to get started.")
+        return
+    # One dataframe widget with row selection instead of a stack of
+    # per-row containers and buttons — the frontend payload stays O(1)
+    # in widget count as the month fills up.
+    entries_df = pd.DataFrame(
+        entries, columns=["ID", "Date", "Business", "Stream", "Quantity (kg)"]
+    )
+    selection = st.dataframe(
+        entries_df,
+        use_container_width=True,
+        hide_index=True,
+        on_select="rerun",
+        selection_mode="single-row",
+        key="entries_table",
+    )
+    selected_rows = selection["selection"]["rows"]
+    if st.button("🗑️ Delete Selected Entry", disabled=not selected_rows):
+        delete_entry(int(entries_df.iloc[selected_rows[0]]["ID"]))
+        st.rerun(scope="app")
+
+monthly_entries_section()
 
 # =========================================================
 # RESET INVENTORY
 # =========================================================
-st.subheader("Reset Inventory")
-if st.button("♻️ Reset All Data"):
+@st.fragment
+def reset_section():
+    st.subheader("Reset Inventory")
     if st.checkbox("Are you absolutely sure? This cannot be undone."):
-        df = pd.DataFrame(columns=["Date", "Business", "Stream", "Quantity (kg)"])
-        save_data(df)
-        log_action("RESET_DATA")
-        st.success("✅ All data reset successfully!")
+        if st.button("♻️ Reset All Data"):
+            reset_inventory()
+            st.toast("✅ All data reset successfully!")
+            st.rerun(scope="app")
+
+reset_section()
 
 # =========================================================
-# ANNUAL TALLY
+# MONTHLY SUMMARY & VISUALIZATION
 # =========================================================
-st.subheader("📅 Annual Tally")
-if not df.empty:
-    df["Year"] = pd.to_datetime(df["Date"]).dt.year
-    yearly_sum = df.groupby("Year")["Quantity (kg)"].sum().reset_index()
-    st.dataframe(yearly_sum, use_container_width=True)
-else:
-    st.info("No data available for annual summary yet.")
+@st.fragment
+def summary_section():
+    col_stats, col_viz = st.columns([1, 2])
+    stream_totals, business_totals = get_monthly_aggregates(current_month)
+
+    with col_stats:
+        st.subheader("📅 Tallies")
+        # The per-stream aggregates already cover every row this month,
+        # so the monthly total falls out of them without another query.
+        monthly_total = sum(stream_totals.values())
+        annual_total = get_annual_total(current_year)
+        st.metric(f"Total for {current_month}", f"{monthly_total:.1f} kg")
+        st.metric(f"Total for {current_year}", f"{annual_total:.1f} kg")
+
+    with col_viz:
+        if stream_totals:
+            st.vega_lite_chart(
+                build_stream_chart(tuple(sorted(stream_totals.items()))),
+                use_container_width=True,
+            )
+            st.vega_lite_chart(
+                build_business_chart(tuple(sorted(business_totals.items()))),
+                use_container_width=True,
+            )
+        else:
+            st.info("No data available yet to visualize.")
+
+summary_section()
 
 # =========================================================
 # CAPACITY TRACKER (PROGRESS BAR)
 # =========================================================
-total_kg = df["Quantity (kg)"].sum() if not df.empty else 0
+total_kg = get_conn().execute(_SQL_TOTAL_STORED).fetchone()[0]
 percent_full = min(total_kg / MAX_CAPACITY, 1.0)
 hue = int(200 - (percent_full * 200))  # blue → red
-progress_color = f"hsl({hue}, 75%, 55%)"
 
 st.markdown(f"### 🏭 Total Waste Stored: **{total_kg:.1f} / {MAX_CAPACITY} kg**")
 st.markdown(
-    f"""
-    <div style='background-color:#ddd; border-radius:20px; height:25px; width:100%;'>
-        <div style='background-color:{progress_color}; width:{percent_full*100}%; height:100%; border-radius:20px;'></div>
-    </div>
-    """,
-    unsafe_allow_html=True
+    f"<style>.stProgress > div > div > div > div {{background-color: hsl({hue}, 75%, 55%);}}</style>",
+    unsafe_allow_html=True,
 )
+st.progress(int(percent_full * 100))
 
 if percent_full >= 0.8:
     st.error("⚠️ WARNING: You are at or above 80% waste capacity!")
 
 # =========================================================
-# VISUALIZATION (Altair)
+# AUDIT LOG
 # =========================================================
-if not df.empty:
-    stream_chart = (
-        alt.Chart(df)
-        .mark_bar()
-        .encode(
-            x=alt.X("Date:T", title="Date"),
-            y=alt.Y("sum(Quantity (kg)):Q", title="Quantity (kg)"),
-            color="Stream:N",
-            tooltip=["Date", "Business", "Stream", "Quantity (kg)"]
-        )
-        .properties(width=800, height=300, title="Waste Accumulation Over Time")
+@st.fragment
+def audit_log_section():
+    st.subheader("📜 Audit Log")
+    audit_rows = get_all_audit(limit=200)
+    if not audit_rows:
+        st.info("No actions logged yet.")
+        return
+    audit_df = pd.DataFrame(
+        audit_rows,
+        columns=["ID", "Event", "Date", "Business", "Stream", "Quantity (kg)", "Timestamp"],
     )
-    st.altair_chart(stream_chart, use_container_width=True)
-else:
-    st.info("No data available yet to visualize.")
+    st.table(audit_df)
 
-# =========================================================
-# LOG VIEWER
-# =========================================================
-st.subheader("📜 Action Log")
-if os.path.exists(LOG_FILE):
-    with open(LOG_FILE, "r") as f:
-        logs = json.load(f)
-    st.json(logs)
-else:
-    st.info("No actions logged yet.")
+audit_log_section()
 
 # =========================================================
 # END